@@ -0,0 +1 @@
+# 讓 pytest 將專案根目錄加入 sys.path，tests/ 內可直接 import main
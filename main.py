@@ -1,15 +1,24 @@
 from fastapi import FastAPI, Response
 from pydantic import BaseModel
 from typing import List, Optional
-import pandas as pd
-import networkx as nx
 from pptx import Presentation
-from pptx.util import Inches, Pt
-from pptx.enum.shapes import MSO_SHAPE, MSO_CONNECTOR
-from pptx.enum.text import PP_ALIGN
+from pptx.util import Pt
+from pptx.enum.shapes import MSO_SHAPE
 from pptx.dml.color import RGBColor
-from collections import defaultdict
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsdecls
+from pptx.shapes.autoshape import AutoShapeType
+from xml.sax.saxutils import escape
+from collections import OrderedDict, defaultdict
+import numpy as np
+import asyncio
+import functools
+import hashlib
 import io
+import json
+import operator
+import re
+import threading
 
 app = FastAPI()
 
@@ -23,13 +32,114 @@ class CircuitData(BaseModel):
     BUILDING_B: Optional[str] = ""
     ROUTER_NAME: Optional[str] = ""
 
+# --- 角色判斷：機房/總部與雲端產品關鍵字 (同一 BUILDING 字串會重複出現，結果以快取保存) ---
+_DC_RE = re.compile(r'HQ|DC|總部|機房')
+_CLOUD_RE = re.compile(r'MPLS|VPN|ADSL')
+
+@functools.lru_cache(maxsize=4096)
+def _role(building: str) -> str:
+    return 'datacenter' if building and _DC_RE.search(building) else 'customer'
+
+# 無向邊的 key：兩端點排序後組成 tuple，同一對站點只會有一條線
+def _edge_key(a: str, b: str) -> tuple:
+    return (a, b) if a <= b else (b, a)
+
+# --- 繪圖樣式常數 (於模組載入時建立一次，繪圖迴圈內直接引用) ---
+EMU_PER_INCH = 914400  # 座標直接以 EMU 整數寫入 XML，不經過 pptx.util.Inches
+LINE_WIDTH = Pt(1.5)
+LINE_COLOR = RGBColor(117, 117, 117)
+LABEL_W_IN = 1.6
+LABEL_FILL = RGBColor(255, 255, 255)
+LABEL_LINE = RGBColor(158, 158, 158)
+LABEL_FONT_SIZE = Pt(8)
+LABEL_FONT_COLOR = RGBColor(33, 33, 33)
+NODE_FONT_SIZE = Pt(9)
+NODE_FONT_COLOR = RGBColor(0, 0, 0)
+
+# role -> (形狀, 寬, 高, 填色, 框線色)
+NODE_STYLES = {
+    'cloud':      (MSO_SHAPE.CLOUD,             2.5, 1.5, RGBColor(227, 242, 253), RGBColor(33, 150, 243)),
+    'datacenter': (MSO_SHAPE.ROUNDED_RECTANGLE, 1.8, 0.8, RGBColor(255, 224, 178), RGBColor(245, 124, 0)),
+    'customer':   (MSO_SHAPE.ROUNDED_RECTANGLE, 1.8, 0.8, RGBColor(238, 238, 238), RGBColor(117, 117, 117)),
+}
+
+# --- 形狀/連線 XML 樣板 (每種樣式只組一次；逐一實體時僅代入 id、座標、尺寸與文字) ---
+_SHAPE_STYLE_XML = (
+    '<p:style><a:lnRef idx="1"><a:schemeClr val="accent1"/></a:lnRef>'
+    '<a:fillRef idx="3"><a:schemeClr val="accent1"/></a:fillRef>'
+    '<a:effectRef idx="2"><a:schemeClr val="accent1"/></a:effectRef>'
+    '<a:fontRef idx="minor"><a:schemeClr val="lt1"/></a:fontRef></p:style>'
+)
+
+def _lst_style_xml(font_size, font_rgb, typeface=None):
+    # 文字樣式寫在 txBody 的 lstStyle，所有段落自動繼承，不必逐段設定
+    latin = '<a:latin typeface="%s"/>' % typeface if typeface else ''
+    return (
+        '<a:lstStyle><a:lvl1pPr algn="ctr"><a:defRPr sz="%d"><a:solidFill><a:srgbClr val="%s"/></a:solidFill>%s'
+        '</a:defRPr></a:lvl1pPr></a:lstStyle>'
+    ) % (font_size.centipoints, font_rgb, latin)
+
+def _sp_template(shape_type, fill_rgb, line_rgb, lst_style):
+    autoshape = AutoShapeType(shape_type)
+    return (
+        '<p:sp %s><p:nvSpPr><p:cNvPr id="{id}" name="%s {idx}"/><p:cNvSpPr/><p:nvPr/></p:nvSpPr>'
+        '<p:spPr><a:xfrm><a:off x="{x}" y="{y}"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+        '<a:prstGeom prst="%s"><a:avLst/></a:prstGeom>'
+        '<a:solidFill><a:srgbClr val="%s"/></a:solidFill>'
+        '<a:ln><a:solidFill><a:srgbClr val="%s"/></a:solidFill></a:ln></p:spPr>'
+        '%s<p:txBody><a:bodyPr rtlCol="0" anchor="ctr"/>%s{paragraphs}</p:txBody></p:sp>'
+    ) % (nsdecls('a', 'p'), autoshape.basename, autoshape.prst, fill_rgb, line_rgb, _SHAPE_STYLE_XML, lst_style)
+
+CXN_TMPL = (
+    '<p:cxnSp %s><p:nvCxnSpPr><p:cNvPr id="{id}" name="Connector {idx}"/><p:cNvCxnSpPr/><p:nvPr/></p:nvCxnSpPr>'
+    '<p:spPr><a:xfrm{flip}><a:off x="{x}" y="{y}"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+    '<a:prstGeom prst="line"><a:avLst/></a:prstGeom>'
+    '<a:ln w="%d"><a:solidFill><a:srgbClr val="%s"/></a:solidFill></a:ln></p:spPr>'
+    '<p:style><a:lnRef idx="2"><a:schemeClr val="accent1"/></a:lnRef>'
+    '<a:fillRef idx="0"><a:schemeClr val="accent1"/></a:fillRef>'
+    '<a:effectRef idx="1"><a:schemeClr val="accent1"/></a:effectRef>'
+    '<a:fontRef idx="minor"><a:schemeClr val="tx1"/></a:fontRef></p:style></p:cxnSp>'
+) % (nsdecls('a', 'p'), LINE_WIDTH, LINE_COLOR)
+
+# 文字處理比照 python-pptx 的 text_frame.text：\n 分段、\v 轉為 <a:br/>、空字串不產生 run，
+# 其餘 XML 不允許的控制字元轉成 _xHHHH_ (否則 parse_xml 會失敗)
+_CTRL_CHAR_RE = re.compile(r'[\x00-\x08\x0B-\x1F]')
+
+def _escape_ctrl_char(match):
+    return '_x%04X_' % ord(match.group())
+
+def _paragraph_xml(line):
+    runs = []
+    for idx, r_str in enumerate(line.split('\v')):
+        if idx > 0:
+            runs.append('<a:br/>')
+        if r_str:
+            runs.append('<a:r><a:t>%s</a:t></a:r>' % escape(_CTRL_CHAR_RE.sub(_escape_ctrl_char, r_str)))
+    return '<a:p>%s</a:p>' % ''.join(runs)
+
+def _paragraphs_xml(text):
+    return ''.join([_paragraph_xml(line) for line in text.split('\n')])
+
+LABEL_TMPL = _sp_template(MSO_SHAPE.RECTANGLE, LABEL_FILL, LABEL_LINE, _lst_style_xml(LABEL_FONT_SIZE, LABEL_FONT_COLOR))
+_node_lst_style = _lst_style_xml(NODE_FONT_SIZE, NODE_FONT_COLOR, 'Arial')
+NODE_TMPLS = {
+    role: _sp_template(shape_type, fill_rgb, line_rgb, _node_lst_style)
+    for role, (shape_type, _, _, fill_rgb, line_rgb) in NODE_STYLES.items()
+}
+
+# --- 預設簡報樣板 (模組載入時序列化一次，每次請求由記憶體載入，不再重新讀取套件內的 default.pptx) ---
+_tmpl_buf = io.BytesIO()
+Presentation().save(_tmpl_buf)
+TEMPLATE_BYTES = _tmpl_buf.getvalue()
+del _tmpl_buf
+
 # --- L2R 排版引擎 (定義在外面) ---
-def apply_l2r_topology_layout(G):
+def apply_l2r_topology_layout(nodes):
     left_nodes = []   # 客戶地址
     center_nodes = [] # 網路/雲端
     right_nodes = []  # 機房/總部
 
-    for n, d in G.nodes(data=True):
+    for n, d in nodes.items():
         role = d.get('role', 'customer')
         if role == 'cloud': center_nodes.append(n)
         elif role == 'datacenter': right_nodes.append(n)
@@ -42,125 +152,154 @@ def apply_l2r_topology_layout(G):
         if not nodes: return
         total_nodes = len(nodes)
         y_spacing = 1.5
-        start_y = 3.75 - ((total_nodes - 1) * y_spacing / 2)
-        for i, node in enumerate(nodes):
-            pos[node] = [x_pos, start_y + (i * y_spacing)]
+        ys = 3.75 + (np.arange(total_nodes) - (total_nodes - 1) / 2) * y_spacing
+        pos.update(zip(nodes, [[x_pos, y] for y in ys.tolist()]))
 
     assign_y_positions(left_nodes, X_LEFT)
     assign_y_positions(center_nodes, X_CENTER)
     assign_y_positions(right_nodes, X_RIGHT)
     return pos
 
-# --- API 執行主體 ---
-@app.post("/generate-pptx")
-def generate_pptx(data: List[CircuitData]):
-    # 1. 將收到的 JSON 轉成 DataFrame 
-    # (註：若您使用最新版 Pydantic v2，可將 .dict() 改為 .model_dump()，若在 Render 報錯請留意此處)
-    df = pd.DataFrame([item.dict() for item in data]).fillna('')
-
-    # 2. 建立 PPT
-    prs = Presentation()
-    prs.slide_width = Inches(13.333)
-    prs.slide_height = Inches(7.5)
+# --- 產出結果快取 (Power Automate 常重送相同資料；以輸入內容雜湊為 key 保存 pptx bytes) ---
+_PPTX_CACHE_MAX = 32
+_pptx_cache = OrderedDict()
+_pptx_cache_lock = threading.Lock()
+
+# 依欄位順序直接取屬性組成 tuple，不經過 .dict()/model_dump() 建立中間 dict
+_payload_row = operator.attrgetter(*CircuitData.model_fields)
+
+def _payload_key(data: List[CircuitData]) -> bytes:
+    # 保留原始順序：資料順序會影響節點排列，順序不同視為不同簡報
+    raw = json.dumps([_payload_row(item) for item in data], ensure_ascii=False)
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).digest()
+
+# --- 簡報產生主體 (同步、CPU 密集；由 API 端點丟到執行緒池執行) ---
+def _render_pptx(data: List[CircuitData]) -> bytes:
+    # 1. 建立 PPT
+    prs = Presentation(io.BytesIO(TEMPLATE_BYTES))
+    prs.slide_width = int(13.333 * EMU_PER_INCH)
+    prs.slide_height = int(7.5 * EMU_PER_INCH)
     slide = prs.slides.add_slide(prs.slide_layouts[6])
     shapes = slide.shapes
 
-    G = nx.Graph()
+    nodes = {}  # site -> {'label': ..., 'role': ...}
     edges_info = defaultdict(list)
 
-    # 3. 解析資料與建立關聯
-    for _, row in df.iterrows():
-        site_a, site_b = str(row['SITE_ID_A']), str(row['SITE_ID_B'])
-        p_type, c_id = str(row['PRODUCT_TYPE']).upper(), str(row['CIRCUIT_ID'])
-        role_a = 'datacenter' if any(k in str(row['BUILDING_A']) for k in ['HQ', 'DC', '總部', '機房']) else 'customer'
-        G.add_node(site_a, label=row['BUILDING_A'], role=role_a)
+    # 2. 解析資料與建立關聯 (直接讀取 Pydantic 物件屬性，不經過 DataFrame)
+    for item in data:
+        # 必填欄位已由 Pydantic 驗證為 str；只有 Optional 欄位可能收到 null
+        site_a, site_b = item.SITE_ID_A, item.SITE_ID_B or ''
+        p_type, c_id = item.PRODUCT_TYPE.upper(), item.CIRCUIT_ID
+        building_a, building_b = item.BUILDING_A, item.BUILDING_B or ''
+        nodes[site_a] = {'label': building_a, 'role': _role(building_a)}
         circuit_label = f"{p_type} [{c_id}]"
-        
-        is_cloud_product = any(x in p_type for x in ['MPLS', 'VPN', 'ADSL'])
+
+        is_cloud_product = _CLOUD_RE.search(p_type) is not None
         if is_cloud_product:
             cloud_id = "Cloud_Network"
-            G.add_node(cloud_id, label="MPLS / VPN / Internet", role='cloud')
-            edges_info[tuple(sorted((site_a, cloud_id)))].append(circuit_label)
+            nodes[cloud_id] = {'label': "MPLS / VPN / Internet", 'role': 'cloud'}
+            edges_info[_edge_key(site_a, cloud_id)].append(circuit_label)
             if site_b:
-                role_b = 'datacenter' if any(k in str(row['BUILDING_B']) for k in ['HQ', 'DC', '總部', '機房']) else 'customer'
-                G.add_node(site_b, label=row['BUILDING_B'], role=role_b)
-                edges_info[tuple(sorted((site_b, cloud_id)))].append(circuit_label)
+                nodes[site_b] = {'label': building_b, 'role': _role(building_b)}
+                edges_info[_edge_key(site_b, cloud_id)].append(circuit_label)
         elif site_b: 
-            role_b = 'datacenter' if any(k in str(row['BUILDING_B']) for k in ['HQ', 'DC', '總部', '機房']) else 'customer'
-            G.add_node(site_b, label=row['BUILDING_B'], role=role_b)
-            edges_info[tuple(sorted((site_a, site_b)))].append(circuit_label)
+            nodes[site_b] = {'label': building_b, 'role': _role(building_b)}
+            edges_info[_edge_key(site_a, site_b)].append(circuit_label)
 
-    # 4. 取得排版座標
-    layout_pos = apply_l2r_topology_layout(G)
+    # 3. 取得排版座標
+    layout_pos = apply_l2r_topology_layout(nodes)
     
-    # 5. 繪製連線與「線路方框」
-    for (u, v), circuits in edges_info.items():
-        if u not in layout_pos or v not in layout_pos: continue
-        
-        x1, y1 = layout_pos[u]
-        x2, y2 = layout_pos[v]
-        
-        # 畫直線
-        conn = shapes.add_connector(MSO_CONNECTOR.STRAIGHT, Inches(x1), Inches(y1), Inches(x2), Inches(y2))
-        conn.line.width = Pt(1.5)
-        conn.line.color.rgb = RGBColor(117, 117, 117)
-        
+    # 4. 繪製連線與「線路方框」
+    #    端點座標整理成陣列 (節點索引 -> xs/ys)，中點與 EMU 一次向量化算完；
+    #    直線與方框皆以樣板組成 XML，最後一次加入 spTree
+    spTree = shapes._spTree
+    shape_id = shapes._next_shape_id
+    label_w = int(LABEL_W_IN * EMU_PER_INCH)
+
+    node_index = {name: i for i, name in enumerate(layout_pos)}
+    xs = np.fromiter((p[0] for p in layout_pos.values()), dtype=np.float64, count=len(layout_pos))
+    ys = np.fromiter((p[1] for p in layout_pos.values()), dtype=np.float64, count=len(layout_pos))
+    edges = [(u, v, circuits) for (u, v), circuits in edges_info.items() if u in node_index and v in node_index]
+
+    if edges:
+        n_edges = len(edges)
+        u_idx = np.fromiter((node_index[u] for u, _, _ in edges), dtype=np.intp, count=n_edges)
+        v_idx = np.fromiter((node_index[v] for _, v, _ in edges), dtype=np.intp, count=n_edges)
+        n_lines = np.fromiter((len(c) for _, _, c in edges), dtype=np.float64, count=n_edges)
+        x1, y1, x2, y2 = xs[u_idx], ys[u_idx], xs[v_idx], ys[v_idx]
         mid_x = (x1 + x2) / 2
         mid_y = (y1 + y2) / 2
-        box_w_in = 1.6
-        box_h_in = 0.25 + 0.15 * len(circuits)
-        
-        circuit_text = "\n".join(circuits)
-        label_box = shapes.add_shape(MSO_SHAPE.RECTANGLE, Inches(mid_x - box_w_in / 2), Inches(mid_y - box_h_in / 2), Inches(box_w_in), Inches(box_h_in))
-        label_box.fill.solid()
-        label_box.fill.fore_color.rgb = RGBColor(255, 255, 255)
-        label_box.line.color.rgb = RGBColor(158, 158, 158)
-        label_box.text_frame.text = circuit_text
-        for p in label_box.text_frame.paragraphs:
-            p.font.size = Pt(8)
-            p.font.color.rgb = RGBColor(33, 33, 33)
-            p.alignment = PP_ALIGN.CENTER
-
-    # 6. 繪製實體節點
-    for node, (x, y) in layout_pos.items():
-        node_data = G.nodes[node]
-        role = node_data.get('role')
-        label = node_data.get('label', node)
-
-        if role == 'cloud':
-            w_in, h_in = 2.5, 1.5
-            shape = shapes.add_shape(MSO_SHAPE.CLOUD, Inches(x - w_in/2), Inches(y - h_in/2), Inches(w_in), Inches(h_in))
-            shape.fill.solid()
-            shape.fill.fore_color.rgb = RGBColor(227, 242, 253)
-            shape.line.color.rgb = RGBColor(33, 150, 243)
-        elif role == 'datacenter':
-            w_in, h_in = 1.8, 0.8
-            shape = shapes.add_shape(MSO_SHAPE.ROUNDED_RECTANGLE, Inches(x - w_in/2), Inches(y - h_in/2), Inches(w_in), Inches(h_in))
-            shape.fill.solid()
-            shape.fill.fore_color.rgb = RGBColor(255, 224, 178)
-            shape.line.color.rgb = RGBColor(245, 124, 0)
-        else:
-            w_in, h_in = 1.8, 0.8
-            shape = shapes.add_shape(MSO_SHAPE.ROUNDED_RECTANGLE, Inches(x - w_in/2), Inches(y - h_in/2), Inches(w_in), Inches(h_in))
-            shape.fill.solid()
-            shape.fill.fore_color.rgb = RGBColor(238, 238, 238)
-            shape.line.color.rgb = RGBColor(117, 117, 117)
-
-        shape.text_frame.text = f"{label}\n[{node}]"
-        for p in shape.text_frame.paragraphs:
-            p.font.size = Pt(9)
-            p.font.name = 'Arial'
-            p.font.color.rgb = RGBColor(0, 0, 0)
-            p.alignment = PP_ALIGN.CENTER
-
-    # 7. 將生成的 PPT 存入記憶體中
+        box_h = 0.25 + 0.15 * n_lines
+
+        bx, by, ex, ey, lx, ly, lh = (
+            (a * EMU_PER_INCH).astype(np.int64).tolist()
+            for a in (x1, y1, x2, y2, mid_x - LABEL_W_IN / 2, mid_y - box_h / 2, box_h)
+        )
+
+        xml_parts = []
+        for i, (_, _, circuits) in enumerate(edges):
+            # 畫直線 (起點在右/下方時以 flipH/flipV 表示方向)
+            flip = (' flipH="1"' if bx[i] > ex[i] else '') + (' flipV="1"' if by[i] > ey[i] else '')
+            xml_parts.append(CXN_TMPL.format(
+                id=shape_id, idx=shape_id - 1, flip=flip,
+                x=min(bx[i], ex[i]), y=min(by[i], ey[i]), cx=abs(ex[i] - bx[i]), cy=abs(ey[i] - by[i]),
+            ))
+            xml_parts.append(LABEL_TMPL.format(
+                id=shape_id + 1, idx=shape_id,
+                x=lx[i], y=ly[i], cx=label_w, cy=lh[i],
+                paragraphs=''.join([_paragraphs_xml(c) for c in circuits]),
+            ))
+            shape_id += 2
+        spTree.extend(list(parse_xml('<root>%s</root>' % ''.join(xml_parts))))
+
+    # 5. 繪製實體節點 (依 role 套用預先組好的樣板；左上角座標以陣列一次換算成 EMU)
+    node_sizes = {
+        role: (int(w_in * EMU_PER_INCH), int(h_in * EMU_PER_INCH))
+        for role, (_, w_in, h_in, _, _) in NODE_STYLES.items()
+    }
+    roles = [r if r in NODE_STYLES else 'customer' for r in (nodes[n].get('role') for n in layout_pos)]
+    half_w = np.fromiter((NODE_STYLES[r][1] / 2 for r in roles), dtype=np.float64, count=len(roles))
+    half_h = np.fromiter((NODE_STYLES[r][2] / 2 for r in roles), dtype=np.float64, count=len(roles))
+    xs_emu = ((xs - half_w) * EMU_PER_INCH).astype(np.int64).tolist()
+    ys_emu = ((ys - half_h) * EMU_PER_INCH).astype(np.int64).tolist()
+
+    for i, (node, role) in enumerate(zip(layout_pos, roles)):
+        label = nodes[node].get('label', node)
+        w_emu, h_emu = node_sizes[role]
+        spTree.append(parse_xml(NODE_TMPLS[role].format(
+            id=shape_id, idx=shape_id - 1,
+            x=xs_emu[i], y=ys_emu[i], cx=w_emu, cy=h_emu,
+            paragraphs=_paragraphs_xml(f"{label}\n[{node}]"),
+        )))
+        shape_id += 1
+
+    # 6. 將生成的 PPT 存入記憶體中 (getvalue() 取得的 bytes 即為快取內容，回應時直接使用、不再複製)
     ppt_stream = io.BytesIO()
     prs.save(ppt_stream)
-    ppt_stream.seek(0)
+    return ppt_stream.getvalue()
+
+def _build_pptx_response(data: List[CircuitData]):
+    key = _payload_key(data)
+    with _pptx_cache_lock:
+        pptx_bytes = _pptx_cache.get(key)
+        if pptx_bytes is not None:
+            _pptx_cache.move_to_end(key)
 
-    # 8. 回傳檔案給 Power Automate
+    if pptx_bytes is None:
+        pptx_bytes = _render_pptx(data)
+        with _pptx_cache_lock:
+            _pptx_cache[key] = pptx_bytes
+            if len(_pptx_cache) > _PPTX_CACHE_MAX:
+                _pptx_cache.popitem(last=False)
+
+    # 7. 回傳檔案給 Power Automate (bytes 已完整在記憶體中，直接回傳並帶 Content-Length)
     return Response(
-        content=ppt_stream.getvalue(),
+        content=pptx_bytes,
         media_type="application/vnd.openxmlformats-officedocument.presentationml.presentation",
         headers={"Content-Disposition": "attachment; filename=network_diagram.pptx"}
-    )
\ No newline at end of file
+    )
+
+# --- API 執行主體 ---
+@app.post("/generate-pptx")
+async def generate_pptx(data: List[CircuitData]):
+    return await asyncio.to_thread(_build_pptx_response, data)
\ No newline at end of file
@@ -0,0 +1,216 @@
+import io
+import random
+from collections import defaultdict
+
+import pytest
+from fastapi.testclient import TestClient
+from pptx import Presentation
+from pptx.dml.color import RGBColor
+from pptx.enum.shapes import MSO_CONNECTOR, MSO_SHAPE
+from pptx.oxml.ns import qn
+from pptx.util import Inches, Pt
+
+import main
+
+PPTX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+
+
+@pytest.fixture
+def client():
+    main._pptx_cache.clear()
+    return TestClient(main.app)
+
+
+def _slide(content):
+    return Presentation(io.BytesIO(content)).slides[0]
+
+
+def _pptx_text_frame(text):
+    prs = Presentation()
+    text_frame = prs.slides.add_slide(prs.slide_layouts[6]).shapes.add_textbox(0, 0, 1, 1).text_frame
+    text_frame.text = text
+    return text_frame
+
+
+def test_empty_payload_returns_blank_deck(client):
+    r = client.post("/generate-pptx", json=[])
+    assert r.status_code == 200
+    assert r.headers["content-type"] == PPTX_MEDIA_TYPE
+    assert len(_slide(r.content).shapes) == 0
+
+
+def test_response_carries_content_length(client):
+    payload = [{"PRODUCT_TYPE": "mpls", "CIRCUIT_ID": "C1", "SITE_ID_A": "S1", "BUILDING_A": "HQ"}]
+    r = client.post("/generate-pptx", json=payload)
+    assert r.status_code == 200
+    assert r.headers["content-disposition"] == "attachment; filename=network_diagram.pptx"
+    assert int(r.headers["content-length"]) == len(r.content)
+
+
+def test_repeat_payload_is_served_from_cache(client, monkeypatch):
+    rows = [
+        {"PRODUCT_TYPE": "mpls", "CIRCUIT_ID": "C1", "SITE_ID_A": "S1", "BUILDING_A": "HQ"},
+        {"PRODUCT_TYPE": "fttb", "CIRCUIT_ID": "C2", "SITE_ID_A": "S2", "BUILDING_A": "Shop", "SITE_ID_B": "S3"},
+    ]
+    calls = []
+    render = main._render_pptx
+    monkeypatch.setattr(main, "_render_pptx", lambda data: calls.append(data) or render(data))
+
+    first = client.post("/generate-pptx", json=rows).content
+    assert client.post("/generate-pptx", json=rows).content == first
+    assert len(calls) == 1
+
+    # 資料順序會影響排版，順序不同不可共用快取
+    client.post("/generate-pptx", json=rows[::-1])
+    assert len(calls) == 2
+
+
+def _lst_style(shape):
+    lvl1 = shape.text_frame._txBody.find("%s/%s" % (qn("a:lstStyle"), qn("a:lvl1pPr")))
+    def_rpr = lvl1.find(qn("a:defRPr"))
+    color = def_rpr.find("%s/%s" % (qn("a:solidFill"), qn("a:srgbClr"))).get("val")
+    latin = def_rpr.find(qn("a:latin"))
+    return lvl1.get("algn"), def_rpr.get("sz"), color, None if latin is None else latin.get("typeface")
+
+
+def test_text_styles_come_from_lst_style(client):
+    payload = [
+        {"PRODUCT_TYPE": "mpls", "CIRCUIT_ID": "C1", "SITE_ID_A": "S1", "BUILDING_A": "HQ"},
+        {"PRODUCT_TYPE": "fttb", "CIRCUIT_ID": "C2", "SITE_ID_A": "S1", "BUILDING_A": "HQ", "SITE_ID_B": "S2", "BUILDING_B": "Shop"},
+    ]
+    r = client.post("/generate-pptx", json=payload)
+    shapes = {sh.text_frame.paragraphs[-1].text: sh for sh in _slide(r.content).shapes if sh.has_text_frame}
+
+    # 線路方框：8pt / 212121，不指定字型
+    assert _lst_style(shapes["FTTB [C2]"]) == ("ctr", "800", "212121", None)
+    # 節點 (cloud / datacenter / customer)：9pt / 000000 / Arial
+    for node_id in ("[Cloud_Network]", "[S1]", "[S2]"):
+        assert _lst_style(shapes[node_id]) == ("ctr", "900", "000000", "Arial")
+
+
+@pytest.mark.parametrize("building", ["Room\x0bB", "X\x01", "Y\x1f", ""])
+def test_control_characters_are_escaped_like_python_pptx(client, building):
+    payload = [{"PRODUCT_TYPE": "FTTB", "CIRCUIT_ID": "C\x07", "SITE_ID_A": "S1", "BUILDING_A": building, "SITE_ID_B": "S2"}]
+    r = client.post("/generate-pptx", json=payload)
+    assert r.status_code == 200
+
+    # 以 python-pptx 的 text setter 產生預期結果 (\v -> 換行、控制字元 -> _xHHHH_)
+    expected = _pptx_text_frame(f"{building}\n[S1]")
+    node = next(sh for sh in _slide(r.content).shapes if sh.has_text_frame and sh.text_frame.text.endswith("[S1]"))
+    assert [p.text for p in node.text_frame.paragraphs] == [p.text for p in expected.paragraphs]
+
+    label = next(sh for sh in _slide(r.content).shapes if sh.has_text_frame and sh.text_frame.text.startswith("FTTB"))
+    assert label.text_frame.text == "FTTB [C_x0007_]"
+
+
+def test_circuit_label_newlines_start_new_paragraphs(client):
+    payload = [
+        {"PRODUCT_TYPE": "fttb", "CIRCUIT_ID": "a\nb", "SITE_ID_A": "S1", "BUILDING_A": "HQ", "SITE_ID_B": "S2"},
+        {"PRODUCT_TYPE": "fttb", "CIRCUIT_ID": "c", "SITE_ID_A": "S1", "BUILDING_A": "HQ", "SITE_ID_B": "S2"},
+    ]
+    r = client.post("/generate-pptx", json=payload)
+    label = next(sh for sh in _slide(r.content).shapes if sh.has_text_frame and sh.text_frame.text.startswith("FTTB"))
+    assert [p.text for p in label.text_frame.paragraphs] == ["FTTB [a", "b]", "FTTB [c]"]
+
+
+# --- 比對用的參考實作：原本以 python-pptx 物件 API (add_shape/add_connector/text_frame.text) 繪製的版本 ---
+def _reference_deck(payload):
+    prs = Presentation()
+    prs.slide_width = Inches(13.333)
+    prs.slide_height = Inches(7.5)
+    slide = prs.slides.add_slide(prs.slide_layouts[6])
+    shapes = slide.shapes
+
+    def role_of(building):
+        return 'datacenter' if any(k in building for k in ['HQ', 'DC', '總部', '機房']) else 'customer'
+
+    nodes = {}
+    edges_info = defaultdict(list)
+    for row in payload:
+        site_a, site_b = row['SITE_ID_A'], row.get('SITE_ID_B') or ''
+        p_type, c_id = row['PRODUCT_TYPE'].upper(), row['CIRCUIT_ID']
+        nodes[site_a] = {'label': row['BUILDING_A'], 'role': role_of(row['BUILDING_A'])}
+        circuit_label = f"{p_type} [{c_id}]"
+        building_b = row.get('BUILDING_B') or ''
+        if any(x in p_type for x in ['MPLS', 'VPN', 'ADSL']):
+            nodes["Cloud_Network"] = {'label': "MPLS / VPN / Internet", 'role': 'cloud'}
+            edges_info[tuple(sorted((site_a, "Cloud_Network")))].append(circuit_label)
+            if site_b:
+                nodes[site_b] = {'label': building_b, 'role': role_of(building_b)}
+                edges_info[tuple(sorted((site_b, "Cloud_Network")))].append(circuit_label)
+        elif site_b:
+            nodes[site_b] = {'label': building_b, 'role': role_of(building_b)}
+            edges_info[tuple(sorted((site_a, site_b)))].append(circuit_label)
+
+    columns = {'customer': [], 'cloud': [], 'datacenter': []}
+    for n, d in nodes.items():
+        columns[d['role']].append(n)
+    pos = {}
+    for role, x_pos in (('customer', 2.0), ('cloud', 6.66), ('datacenter', 11.33)):
+        start_y = 3.75 - ((len(columns[role]) - 1) * 1.5 / 2)
+        for i, n in enumerate(columns[role]):
+            pos[n] = [x_pos, start_y + i * 1.5]
+
+    for (u, v), circuits in edges_info.items():
+        x1, y1 = pos[u]
+        x2, y2 = pos[v]
+        conn = shapes.add_connector(MSO_CONNECTOR.STRAIGHT, Inches(x1), Inches(y1), Inches(x2), Inches(y2))
+        conn.line.width = Pt(1.5)
+        conn.line.color.rgb = RGBColor(117, 117, 117)
+        box_h_in = 0.25 + 0.15 * len(circuits)
+        label_box = shapes.add_shape(MSO_SHAPE.RECTANGLE, Inches((x1 + x2) / 2 - 0.8), Inches((y1 + y2) / 2 - box_h_in / 2), Inches(1.6), Inches(box_h_in))
+        label_box.fill.solid()
+        label_box.fill.fore_color.rgb = RGBColor(255, 255, 255)
+        label_box.line.color.rgb = RGBColor(158, 158, 158)
+        label_box.text_frame.text = "\n".join(circuits)
+
+    styles = {
+        'cloud': (MSO_SHAPE.CLOUD, 2.5, 1.5, RGBColor(227, 242, 253), RGBColor(33, 150, 243)),
+        'datacenter': (MSO_SHAPE.ROUNDED_RECTANGLE, 1.8, 0.8, RGBColor(255, 224, 178), RGBColor(245, 124, 0)),
+        'customer': (MSO_SHAPE.ROUNDED_RECTANGLE, 1.8, 0.8, RGBColor(238, 238, 238), RGBColor(117, 117, 117)),
+    }
+    for node, (x, y) in pos.items():
+        shape_type, w_in, h_in, fill_rgb, line_rgb = styles[nodes[node]['role']]
+        shape = shapes.add_shape(shape_type, Inches(x - w_in / 2), Inches(y - h_in / 2), Inches(w_in), Inches(h_in))
+        shape.fill.solid()
+        shape.fill.fore_color.rgb = fill_rgb
+        shape.line.color.rgb = line_rgb
+        shape.text_frame.text = f"{nodes[node]['label']}\n[{node}]"
+    return prs
+
+
+def _describe(prs):
+    # 比對幾何、形狀種類、顏色與文字；字型樣式改放在 lstStyle，不列入比對
+    slide = prs.slides[0]
+    described = [(prs.slide_width, prs.slide_height)]
+    for sh in slide.shapes:
+        xfrm = sh._element.spPr.xfrm
+        item = [sh.shape_id, sh.name, sh.left, sh.top, sh.width, sh.height, xfrm.get('flipH'), xfrm.get('flipV'), str(sh.line.color.rgb)]
+        if sh.has_text_frame:
+            item += [sh.auto_shape_type, str(sh.fill.fore_color.rgb), [p.text for p in sh.text_frame.paragraphs]]
+        described.append(item)
+    return described
+
+
+def _random_payload(rng):
+    sites = [f"S{i}" for i in range(12)]
+    words = ["HQ", "Branch", "台北機房", "總部", "DC-2", "Shop & Co <1>", "Room\x0bB", "X\x01", "", "Line\nTwo"]
+    rows = []
+    for i in range(rng.randint(1, 40)):
+        rows.append({
+            "PRODUCT_TYPE": rng.choice(["mpls", "VPN", "adsl", "fttb", "Leased Line"]),
+            "CIRCUIT_ID": rng.choice([f"C{i}", f"C{i}\nx", f"C{i}\x07"]),
+            "SITE_ID_A": rng.choice(sites),
+            "BUILDING_A": rng.choice(words),
+            "SITE_ID_B": rng.choice(sites + ["", None]),
+            "BUILDING_B": rng.choice(words + [None]),
+        })
+    return rows
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_python_pptx_reference_rendering(client, seed):
+    payload = _random_payload(random.Random(seed))
+    r = client.post("/generate-pptx", json=payload)
+    assert r.status_code == 200
+    assert _describe(Presentation(io.BytesIO(r.content))) == _describe(_reference_deck(payload))